@@ -1,8 +1,25 @@
+import ast
+import asyncio
+import concurrent.futures
+import functools
+import importlib.util
 import json
-from datetime import date, timedelta
+import operator
+import sys
+from collections import deque
+from datetime import date
 from enum import Enum
+from typing import Callable
+import httpx
 from pydantic import BaseModel, Field
-from mistralai import Mistral
+from mistralai import AssistantMessage, Function, Mistral, Tool, ToolMessage, UserMessage
+
+# orjson is an optional, faster drop-in for decoding tool-call arguments
+try:
+    import orjson
+    parse_json = orjson.loads
+except ImportError:
+    parse_json = json.loads
 
 # --- Step 1: Define Pydantic Models for Tool Inputs ---
 
@@ -44,17 +61,58 @@ class DateInput(BaseModel):
 # Text Analysis Tool Input: Validates text analysis parameters
 class TextAnalysisInput(BaseModel):
     text: str = Field(..., description="The text to analyze")
-    character: str = Field(..., description="The character to count in the text")
+    character: str = Field(..., min_length=1, max_length=1, description="The single character to count in the text")
     case_sensitive: bool = Field(False, description="Whether the search should be case sensitive")
 
 # --- Step 2: Implement Tool Functions ---
 
-def math_tool(input: MathInput) -> float:
+# Limits on ** so a model-generated expression cannot tie up a worker thread
+MAX_EXPONENT = 1000
+MAX_POWER_BITS = 10_000
+
+def _bounded_pow(base: float, exponent: float) -> float:
+    """Raises base to exponent, rejecting exponents or results that are too large."""
+    if abs(exponent) > MAX_EXPONENT:
+        raise ValueError(f"Exponent too large: {exponent}")
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base).bit_length() * exponent > MAX_POWER_BITS:
+        raise ValueError("Result of ** is too large")
+    return base ** exponent
+
+# Operators allowed in math expressions
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _bounded_pow,
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+def _eval_node(node: ast.AST) -> float:
+    """Recursively evaluates an arithmetic AST node."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return BINARY_OPERATORS[type(node.op)](_eval_node(node.left), _eval_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_eval_node(node.operand))
+    raise ValueError(f"Unsupported syntax: {ast.dump(node)}")
+
+@functools.lru_cache(maxsize=256)
+def evaluate_expression(expression: str) -> float:
+    """Parses and evaluates an arithmetic expression, caching by expression string."""
+    tree = ast.parse(expression, mode="eval")
+    return _eval_node(tree.body)
+
+def math_tool(expression: str) -> float:
     """Evaluates a mathematical expression."""
-    # Note: eval() is used for simplicity; in production, use safer alternatives
     try:
-        result = eval(input.expression)
-        return result
+        return evaluate_expression(expression)
     except Exception as e:
         raise ValueError(f"Invalid expression: {str(e)}")
 
@@ -69,171 +127,339 @@ conversion_to_m = {
     "inches": 0.0254,
 }
 
-def unit_conversion_tool(input: UnitConversionInput) -> float:
+# Position of each unit in the conversion matrix, following enum declaration order
+UNIT_INDEX = {unit: i for i, unit in enumerate(LengthUnit)}
+
+# Direct conversion factors, indexed as conversion_ratios[from_index][to_index]
+conversion_ratios = tuple(
+    tuple(conversion_to_m[from_unit.value] / conversion_to_m[to_unit.value] for to_unit in LengthUnit)
+    for from_unit in LengthUnit
+)
+
+def unit_conversion_tool(value: float, from_unit: LengthUnit, to_unit: LengthUnit) -> float:
     """Converts a value between length units."""
-    if input.from_unit not in conversion_to_m or input.to_unit not in conversion_to_m:
-        raise ValueError("Invalid unit specified")
-    value_in_m = input.value * conversion_to_m[input.from_unit]
-    converted_value = value_in_m / conversion_to_m[input.to_unit]
-    return converted_value
+    # Units are validated by the LengthUnit enum, so both always have an index
+    return value * conversion_ratios[UNIT_INDEX[from_unit]][UNIT_INDEX[to_unit]]
+
+def _get_current_date(base_date: date, days: int, second_date: date) -> str:
+    return date.today().isoformat()
+
+def _add_days(base_date: date, days: int, second_date: date) -> str:
+    if base_date is None or days is None:
+        raise ValueError("base_date and days are required for add_days")
+    return date.fromordinal(base_date.toordinal() + days).isoformat()
+
+def _subtract_days(base_date: date, days: int, second_date: date) -> str:
+    if base_date is None or days is None:
+        raise ValueError("base_date and days are required for subtract_days")
+    return date.fromordinal(base_date.toordinal() - days).isoformat()
+
+def _diff_days(base_date: date, days: int, second_date: date) -> str:
+    if base_date is None or second_date is None:
+        raise ValueError("base_date and second_date are required for diff_days")
+    return str(second_date.toordinal() - base_date.toordinal())
+
+# Handler for each date operation; the DateOperation enum guarantees a match
+DATE_OPERATIONS = {
+    DateOperation.get_current: _get_current_date,
+    DateOperation.add_days: _add_days,
+    DateOperation.subtract_days: _subtract_days,
+    DateOperation.diff_days: _diff_days,
+}
 
-def date_tool(input: DateInput) -> str:
+def date_tool(operation: DateOperation, base_date: date = None, days: int = None, second_date: date = None) -> str:
     """Performs date operations."""
-    if input.operation == "get_current":
-        return str(date.today())
-    elif input.operation == "add_days":
-        if input.base_date is None or input.days is None:
-            raise ValueError("base_date and days are required for add_days")
-        new_date = input.base_date + timedelta(days=input.days)
-        return str(new_date)
-    elif input.operation == "subtract_days":
-        if input.base_date is None or input.days is None:
-            raise ValueError("base_date and days are required for subtract_days")
-        new_date = input.base_date - timedelta(days=input.days)
-        return str(new_date)
-    elif input.operation == "diff_days":
-        if input.base_date is None or input.second_date is None:
-            raise ValueError("base_date and second_date are required for diff_days")
-        diff = (input.second_date - input.base_date).days
-        return str(diff)
-    else:
-        raise ValueError("Invalid date operation")
+    return DATE_OPERATIONS[operation](base_date, days, second_date)
 
-def text_analysis_tool(input: TextAnalysisInput) -> str:
+def text_analysis_tool(text: str, character: str, case_sensitive: bool = False) -> str:
     """Counts occurrences of a character in text."""
-    text = input.text if input.case_sensitive else input.text.lower()
-    character = input.character if input.case_sensitive else input.character.lower()
-    
-    count = text.count(character)
+    if case_sensitive or (character.isascii() and not character.isalpha()):
+        # ASCII digits and punctuation have no case, so count them as-is
+        count = text.count(character)
+    elif character.isascii() and text.isascii():
+        # Count both cases directly instead of allocating a lowercased copy of the text
+        lower, upper = character.lower(), character.upper()
+        count = text.count(lower)
+        if upper != lower:
+            count += text.count(upper)
+    else:
+        count = text.lower().count(character.lower())
     
-    return f"The character '{input.character}' appears {count} times in '{input.text}'"
+    return f"The character '{character}' appears {count} times in '{text}'"
 
 # --- Step 3: Define Tool Specifications for Mistral AI ---
 
+# JSON schemas are generated once here rather than inline in each tool spec
+MATH_SCHEMA = MathInput.model_json_schema()
+UNIT_CONVERSION_SCHEMA = UnitConversionInput.model_json_schema()
+DATE_SCHEMA = DateInput.model_json_schema()
+TEXT_ANALYSIS_SCHEMA = TextAnalysisInput.model_json_schema()
+
+# Tool specs are built as SDK models; the client passes models through as-is
+# instead of re-validating every schema dict on each request
 tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "math",
-            "description": "Evaluates a mathematical expression (e.g., '5 + 3 * 2')",
-            "parameters": MathInput.schema(),
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "unit_conversion",
-            "description": "Converts a value between length units (e.g., km to miles)",
-            "parameters": UnitConversionInput.schema(),
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "date_tool",
-            "description": "Performs date operations (e.g., add days, get current date)",
-            "parameters": DateInput.schema(),
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "text_analysis",
-            "description": "Analyzes text for specific character occurrences",
-            "parameters": TextAnalysisInput.schema(),
-        },
-    },
+    Tool(
+        type="function",
+        function=Function(
+            name="math",
+            description="Evaluates a mathematical expression (e.g., '5 + 3 * 2')",
+            parameters=MATH_SCHEMA,
+        ),
+    ),
+    Tool(
+        type="function",
+        function=Function(
+            name="unit_conversion",
+            description="Converts a value between length units (e.g., km to miles)",
+            parameters=UNIT_CONVERSION_SCHEMA,
+        ),
+    ),
+    Tool(
+        type="function",
+        function=Function(
+            name="date_tool",
+            description="Performs date operations (e.g., add days, get current date)",
+            parameters=DATE_SCHEMA,
+        ),
+    ),
+    Tool(
+        type="function",
+        function=Function(
+            name="text_analysis",
+            description="Analyzes text for specific character occurrences",
+            parameters=TEXT_ANALYSIS_SCHEMA,
+        ),
+    ),
 ]
 
 # --- Step 4: Set Up Mistral AI Client ---
 
+# Same as the SDK's default async client, plus HTTP/2 (when h2 is installed)
+# to multiplex the concurrent requests and pool limits sized for them
+http_client = httpx.AsyncClient(
+    follow_redirects=True,
+    http2=importlib.util.find_spec("h2") is not None,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+)
+
 # Replace 'your_api_key' with your actual Mistral AI API key
-client = Mistral(api_key= "")
+client = Mistral(api_key= "", async_client=http_client)
 
 # --- Step 5: Helper Function to Execute Tools ---
 
+# Maps each tool name to its input model and implementation
+TOOL_HANDLERS = {
+    "math": (MathInput, math_tool),
+    "unit_conversion": (UnitConversionInput, unit_conversion_tool),
+    "date_tool": (DateInput, date_tool),
+    "text_analysis": (TextAnalysisInput, text_analysis_tool),
+}
+
 def call_tool(tool_name: str, params: dict) -> str:
     """Executes the appropriate tool based on name and parameters."""
     try:
-        if tool_name == "math":
-            input_model = MathInput(**params)
-            return str(math_tool(input_model))
-        elif tool_name == "unit_conversion":
-            input_model = UnitConversionInput(**params)
-            return str(unit_conversion_tool(input_model))
-        elif tool_name == "date_tool":
-            input_model = DateInput(**params)
-            return date_tool(input_model)
-        elif tool_name == "text_analysis":
-            input_model = TextAnalysisInput(**params)
-            return str(text_analysis_tool(input_model))
-        else:
+        # Names decoded from JSON are fresh strings; interning them makes the
+        # TOOL_HANDLERS lookup below match on the identity fast path
+        tool_name = sys.intern(tool_name)
+        handler = TOOL_HANDLERS.get(tool_name)
+        if handler is None:
             raise ValueError(f"Unknown tool: {tool_name}")
+        input_model, tool = handler
+        # Validation happens here; the tools themselves only see plain field values
+        validated = input_model.model_validate(params)
+        # str() is a no-op for tools that already return strings
+        return str(tool(**vars(validated)))
     except Exception as e:
         return f"Error: {str(e)}"
 
+# Shared worker threads for tool execution, sized for the concurrent conversations
+tool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+async def call_tool_async(tool_name: str, params: dict) -> str:
+    """Executes a tool in a worker thread so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor, call_tool, tool_name, params)
+
 # --- Step 6: Conversation Loop ---
 
-def handle_conversation(user_query: str) -> None:
-    """Handles the conversation with the agent, including tool calls."""
-    print(f"User Query: {user_query}")
-    messages = [{"role": "user", "content": user_query}]
+def start_tool_call(tool_call: dict, log: Callable[[str], None]) -> asyncio.Task:
+    """Parses a tool call's arguments and starts executing it in the background."""
+    tool_name = tool_call["function"]["name"]
+    params = parse_json(tool_call["function"]["arguments"])
+    log(f"Agent decided to use tool: {tool_name} with params: {params}")
+    return asyncio.create_task(call_tool_async(tool_name, params))
+
+async def stream_assistant_turn(messages: list, log: Callable[[str], None]) -> tuple[dict, list[asyncio.Future]]:
+    """Streams one assistant turn from Mistral AI.
+
+    Each tool call is started as soon as its arguments form complete JSON,
+    so tool execution overlaps with the rest of the response. Returns the
+    assistant message and the tool-call tasks in call order.
+    """
+    stream = await client.chat.stream_async(
+        model="mistral-small-2506",
+        messages=messages,
+        tools=tools,
+        tool_choice="auto",
+    )
+    content = []
+    tool_calls = []
+    tasks = {}
+    # Position in tool_calls of each open call, by stream index and by id
+    positions_by_index = {}
+    positions_by_id = {}
+
+    async with stream:
+        async for event in stream:
+            delta = event.data.choices[0].delta
+            if isinstance(delta.content, str):
+                content.append(delta.content)
+
+            for fragment in delta.tool_calls or []:
+                arguments = fragment.function.arguments
+                if not isinstance(arguments, str):
+                    arguments = json.dumps(arguments)
+
+                # The SDK fills in index=0 and id="null" when a fragment omits
+                # them, so only trust the fields that were actually sent
+                sent = fragment.model_fields_set
+                has_index = "index" in sent and fragment.index is not None
+                has_id = "id" in sent and fragment.id not in (None, "null")
+
+                position = None
+                if has_id and fragment.id in positions_by_id:
+                    position = positions_by_id[fragment.id]
+                elif has_index and fragment.index in positions_by_index:
+                    position = positions_by_index[fragment.index]
+                    # A different id at a known index is a new call, not a continuation
+                    if has_id and tool_calls[position]["id"] not in (None, "null"):
+                        position = None
+                elif not has_index and not has_id and tool_calls:
+                    position = len(tool_calls) - 1
+
+                if position is None:
+                    position = len(tool_calls)
+                    tool_calls.append({
+                        "id": fragment.id,
+                        "type": "function",
+                        "function": {"name": fragment.function.name, "arguments": ""},
+                    })
+                    if has_index:
+                        positions_by_index[fragment.index] = position
+                if has_id:
+                    positions_by_id[fragment.id] = position
+                    tool_calls[position]["id"] = fragment.id
+
+                tool_call = tool_calls[position]
+                if not tool_call["function"]["name"]:
+                    tool_call["function"]["name"] = fragment.function.name
+                tool_call["function"]["arguments"] += arguments
+
+                if position not in tasks and tool_call["function"]["arguments"].rstrip().endswith("}"):
+                    try:
+                        tasks[position] = start_tool_call(tool_call, log)
+                    except json.JSONDecodeError:
+                        pass  # Arguments are still incomplete
+
+    # Start any call whose arguments only became complete at the end of the stream;
+    # arguments that never parse are reported back to the model as a tool error
+    for position, tool_call in enumerate(tool_calls):
+        if position not in tasks:
+            try:
+                tasks[position] = start_tool_call(tool_call, log)
+            except json.JSONDecodeError as e:
+                log(f"Agent sent invalid arguments for tool: {tool_call['function']['name']}")
+                tasks[position] = asyncio.get_running_loop().create_future()
+                tasks[position].set_result(f"Error: Invalid tool arguments: {e}")
+
+    assistant_message = {"role": "assistant", "content": "".join(content)}
+    if tool_calls:
+        assistant_message["tool_calls"] = tool_calls
+    return assistant_message, [tasks[position] for position in range(len(tool_calls))]
+
+# Most recent messages sent with each request, in addition to the user query
+MAX_HISTORY_MESSAGES = 32
+
+async def handle_conversation(user_query: str, log: Callable[[str], None] = print) -> None:
+    """Handles the conversation with the agent, including tool calls.
+
+    Output lines go to `log`, so concurrent conversations can be buffered
+    separately instead of interleaving on stdout.
+    """
+    log(f"User Query: {user_query}")
+    # History is kept as SDK message models, built once per message, so each
+    # request does not re-validate every earlier message from plain dicts.
+    # The query is pinned while older turns fall out of the bounded history.
+    query_message = UserMessage(content=user_query)
+    # Each turn is an assistant message followed by its tool results, evicted
+    # together so a tool result is never sent without its tool call
+    turns = deque()
+    history_size = 0
 
     while True:
-        # Send the message to Mistral AI and get a response
-        response = client.chat.complete(
-            model="mistral-small-2506",
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
-        )
-        assistant_message = response.choices[0].message
-        messages.append(assistant_message)
-
-        if assistant_message.tool_calls:
-            # Handle each tool call in the response
-            for tool_call in assistant_message.tool_calls:
-                tool_name = tool_call.function.name
-                params = json.loads(tool_call.function.arguments)
-                print(f"Agent decided to use tool: {tool_name} with params: {params}")
-                
-                result = call_tool(tool_name, params)
-                print(f"Tool result: {result}")
+        window = [message for turn in turns for message in turn]
+
+        # Stream the response; tool calls start running while it is still arriving
+        assistant_message, tasks = await stream_assistant_turn([query_message, *window], log)
+
+        if tasks:
+            results = await asyncio.gather(*tasks)
+
+            turn = [AssistantMessage.model_validate(assistant_message)]
+            for tool_call, result in zip(assistant_message["tool_calls"], results):
+                log(f"Tool result: {result}")
                 
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": result,
-                })
+                turn.append(ToolMessage(tool_call_id=tool_call["id"], content=result))
+
+            turns.append(turn)
+            history_size += len(turn)
+            # The latest turn is always kept, even if it alone exceeds the limit
+            while history_size > MAX_HISTORY_MESSAGES and len(turns) > 1:
+                history_size -= len(turns.popleft())
         else:
-            print(f"Agent Response: {assistant_message.content}")
+            log(f"Agent Response: {assistant_message['content']}")
             break
 
 # --- Step 7: Demonstrate the Agent with Example Queries ---
 
-if __name__ == "__main__":
-    print("=== Welcome to the Agent Tools Demo ===\n")
-
+examples = [
     # Example 1: Using the Math Tool
-    print("--- Example 1: Mathematical Calculation ---")
-    handle_conversation("What is 698552 multiplied by 659 subtract 25574 divided by 2 is an eighth of the people who attended the show. How many people attended the show?")
-
+    ("Mathematical Calculation", "What is 698552 multiplied by 659 subtract 25574 divided by 2 is an eighth of the people who attended the show. How many people attended the show?"),
     # Example 2: Using the Unit Conversion Tool
-    print("\n--- Example 2: Unit Conversion ---")
-    handle_conversation("Convert 10 kilometers to miles.")
-
+    ("Unit Conversion", "Convert 10 kilometers to miles."),
     # Example 3: Using the Date Tool (Add Days)
-    print("\n--- Example 3: Date Operation (Add Days) ---")
-    handle_conversation("What is the date 5 days from now?")
-
+    ("Date Operation (Add Days)", "What is the date 5 days from now?"),
     # Example 4: Using the Date Tool (Difference in Days)
-    print("\n--- Example 4: Date Operation (Difference) ---")
-    handle_conversation("How many days are between 2023-01-01 and 2023-12-31?")
-
+    ("Date Operation (Difference)", "How many days are between 2023-01-01 and 2023-12-31?"),
     # Example 5: Direct Response (No Tool Needed)
-    print("\n--- Example 5: Direct Response ---")
-    handle_conversation("Hello, how are you?")
-
+    ("Direct Response", "Hello, how are you?"),
     # Example 6: Text Analysis Tool
-    print("\n--- Example 6: Text Analysis (Character Count) ---")
-    handle_conversation("How many r's are in strawberry?")
\ No newline at end of file
+    ("Text Analysis (Character Count)", "How many r's are in strawberry?"),
+]
+
+async def main() -> None:
+    """Runs all example conversations concurrently."""
+    # Each conversation is network-bound, so overlapping them makes the demo
+    # take roughly as long as the slowest one instead of the sum of all six.
+    # Output is buffered per example and printed in order once all finish;
+    # a failing conversation is reported in its own block without cutting
+    # the others short.
+    outputs = [[] for _ in examples]
+    results = await asyncio.gather(
+        *(handle_conversation(query, output.append) for (_, query), output in zip(examples, outputs)),
+        return_exceptions=True,
+    )
+
+    # Every conversation has settled, so the shared client and workers can go
+    await http_client.aclose()
+    tool_executor.shutdown(wait=False)
+
+    for number, ((title, _), output, result) in enumerate(zip(examples, outputs, results), start=1):
+        if isinstance(result, Exception):
+            output.append(f"Error: {result}")
+        print(f"--- Example {number}: {title} ---")
+        print("\n".join(output) + "\n")
+
+if __name__ == "__main__":
+    print("=== Welcome to the Agent Tools Demo ===\n")
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from mistralai.models import CompletionEvent
+
+import main
+
+
+def tool_event(*fragments):
+    """Builds a stream event whose delta carries the given tool-call fragments."""
+    return CompletionEvent.model_validate({
+        "data": {
+            "id": "event",
+            "model": "test",
+            "choices": [{"index": 0, "delta": {"tool_calls": list(fragments)}, "finish_reason": None}],
+        }
+    })
+
+
+def fragment(arguments, name="math", **fields):
+    return {"function": {"name": name, "arguments": arguments}, **fields}
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+def run_turn(monkeypatch, events):
+    """Streams one assistant turn from fake events and returns its tool calls and results."""
+    async def fake_stream_async(**kwargs):
+        return FakeStream(events)
+
+    async def turn():
+        message, tasks = await main.stream_assistant_turn([], lambda line: None)
+        return message["tool_calls"], await asyncio.gather(*tasks)
+
+    monkeypatch.setattr(main.client.chat, "stream_async", fake_stream_async)
+    return asyncio.run(turn())
+
+
+def test_split_fragment_without_index_extends_latest_call(monkeypatch):
+    tool_calls, results = run_turn(monkeypatch, [
+        tool_event(fragment('{"expression": "1+1"}', id="a1")),
+        tool_event(fragment('{"expression": ', id="b2")),
+        tool_event(fragment('"2*3"}', name="")),
+    ])
+    assert [call["id"] for call in tool_calls] == ["a1", "b2"]
+    assert results == ["2", "6"]
+
+
+def test_index_only_fragments(monkeypatch):
+    tool_calls, results = run_turn(monkeypatch, [
+        tool_event(fragment('{"expression": ', index=0), fragment('{"expression": ', index=1)),
+        tool_event(fragment('"1+1"}', name="", index=0), fragment('"2*3"}', name="", index=1)),
+    ])
+    assert [call["function"]["arguments"] for call in tool_calls] == [
+        '{"expression": "1+1"}',
+        '{"expression": "2*3"}',
+    ]
+    assert results == ["2", "6"]
+
+
+def test_id_only_fragments(monkeypatch):
+    tool_calls, results = run_turn(monkeypatch, [
+        tool_event(fragment('{"expression": ', id="a1"), fragment('{"expression": ', id="b2")),
+        tool_event(fragment('"2*3"}', name="", id="b2"), fragment('"1+1"}', name="", id="a1")),
+    ])
+    assert [call["id"] for call in tool_calls] == ["a1", "b2"]
+    assert results == ["2", "6"]
+
+
+def test_invalid_arguments_become_tool_error(monkeypatch):
+    tool_calls, results = run_turn(monkeypatch, [
+        tool_event(fragment('{"expression": ', id="a1")),
+    ])
+    assert len(tool_calls) == 1
+    assert results[0].startswith("Error: Invalid tool arguments")
+
+
+def test_history_evicts_whole_turns_and_keeps_latest(monkeypatch):
+    turns = [
+        [tool_event(fragment('{"expression": "1"}', id="a1"))],
+        [tool_event(*(fragment('{"expression": "2"}', id=f"b{i}") for i in range(4)))],
+        [],
+    ]
+    requests = []
+
+    async def fake_stream_async(**kwargs):
+        requests.append(kwargs["messages"])
+        return FakeStream(turns[len(requests) - 1])
+
+    monkeypatch.setattr(main, "MAX_HISTORY_MESSAGES", 3)
+    monkeypatch.setattr(main.client.chat, "stream_async", fake_stream_async)
+    asyncio.run(main.handle_conversation("query", lambda line: None))
+
+    # The first turn is evicted as a unit; the oversized latest turn is kept whole
+    assert [type(message).__name__ for message in requests[2]] == [
+        "UserMessage", "AssistantMessage", *["ToolMessage"] * 4,
+    ]
+    assert [message.tool_call_id for message in requests[2][2:]] == ["b0", "b1", "b2", "b3"]
+
+
+def test_math_evaluates_arithmetic():
+    assert main.call_tool("math", {"expression": "698552 * 659 - 25574 / 2"}) == "460332981.0"
+    assert main.evaluate_expression("-(2 + 3) * +4") == -20
+    assert main.evaluate_expression("2 ** -2") == 0.25
+
+
+def test_math_rejects_non_arithmetic_syntax():
+    for expression in ["x + 1", "__import__('os')", "(1).real", "True + 1", "1j * 2"]:
+        assert main.call_tool("math", {"expression": expression}).startswith("Error: Invalid expression")
+
+
+def test_math_rejects_oversized_powers_quickly():
+    start = time.perf_counter()
+    # Exponents over MAX_EXPONENT, and results over MAX_POWER_BITS with a small exponent
+    for expression in ["9**9**9**9", "2**10**10", f"2**{main.MAX_EXPONENT + 1}", "(2**20)**600"]:
+        assert main.call_tool("math", {"expression": expression}).startswith("Error:")
+    assert time.perf_counter() - start < 1
+    # Powers within both limits still evaluate
+    assert main.evaluate_expression(f"2**{main.MAX_EXPONENT}") == 2 ** main.MAX_EXPONENT